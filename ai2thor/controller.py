@@ -938,6 +938,7 @@ class Controller(object):
         self.server.stop()
         self.stop_container()
         self.unlock_release()
+        self.interactive_controller.close()
 
     def stop_container(self):
         if self.container_id:
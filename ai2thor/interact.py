@@ -1,12 +1,20 @@
 import tty
 import sys
 import termios
-from PIL import Image
 import numpy as np
+import cv2
 import os
 
+from collections import ChainMap
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
 from enum import Enum
+from itertools import count
+from operator import itemgetter
 import json
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 class DefaultActions(Enum):
@@ -35,25 +43,60 @@ class DefaultActions(Enum):
 #     ToggleObjectOff
 
 
-def get_term_character():
-    fd = sys.stdin.fileno()
+@contextmanager
+def terminal_input_mode(fd):
+    # cbreak rather than raw keeps output processing, so prints still return
+    # the carriage, and Ctrl-C still raises KeyboardInterrupt
     old_settings = termios.tcgetattr(fd)
     try:
-        tty.setraw(sys.stdin.fileno())
-        ch = sys.stdin.read(1)
+        tty.setcbreak(fd)
+        yield
     finally:
         termios.tcsetattr(fd, termios.TCSADRAIN, old_settings)
-    return ch
+
+
+def get_term_character(fd):
+    # escape sequences arrive as one chunk, so a single read returns the whole key
+    return os.read(fd, 8).decode('utf-8', 'ignore')
+
+
+def save_image(name, image):
+    # low zlib effort, frames are written on every interactive step
+    cv2.imwrite("{}.png".format(name), image, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+
+
+def save_depth_raw(name, depth):
+    np.save(name, depth.astype(np.float32, copy=False))
+
+
+def json_write(name, obj):
+    with open("{}.json".format(name), 'w') as outfile:
+        json.dump(obj, outfile, indent=4, sort_keys=True)
+
+
+def command_prefixes(commands):
+    return {k[:i] for k in commands for i in range(1, len(k) + 1)}
 
 
 class InteractiveControllerPrompt(object):
-    def __init__(self, default_actions, has_object_actions=True, image_dir='.', image_per_frame=False):
+    def __init__(self, default_actions, has_object_actions=True, image_dir='.', image_per_frame=False, verbose=False):
         self.default_actions = default_actions
         self.has_object_actions = has_object_actions
         self.image_per_frame = image_per_frame
         self.image_dir = image_dir
+        # escape '%' so the directory name is never read as a format directive
+        self._image_path_template = os.path.join(os.fspath(image_dir).replace('%', '%%'), "%s%s")
+        self.verbose = verbose
         self.counter = 0
 
+        # scratch buffers reused across frames by write_image
+        self._depth_scratch_u8 = None
+
+        # frames are written in the background while the next step runs;
+        # the pool is created on first write and released by close()
+        self._io_pool = None
+        self._pending_writes = []
+
         default_interact_commands = {
             '\x1b[C': dict(action='MoveRight', moveMagnitude=0.25),
             '\x1b[D': dict(action='MoveLeft', moveMagnitude=0.25),
@@ -73,6 +116,7 @@ class InteractiveControllerPrompt(object):
         self.default_interact_commands = {
             k: v for (k, v) in default_interact_commands.items() if v['action'] in action_set
         }
+        self._default_command_prefixes = command_prefixes(self.default_interact_commands)
 
     def interact(self,
                  controller,
@@ -88,196 +132,208 @@ class InteractiveControllerPrompt(object):
 
         default_interact_commands = self.default_interact_commands
 
-        self._interact_commands = default_interact_commands.copy()
+        self._interact_commands = default_interact_commands
+        self._interact_command_prefixes = self._default_command_prefixes
 
         command_message = u"Enter a Command: Move \u2190\u2191\u2192\u2193, Rotate/Look Shift + \u2190\u2191\u2192\u2193, Quit 'q' or Ctrl-C"
         print(command_message)
-        for a in self.next_interact_command():
-            new_commands = {}
-            command_counter = dict(counter=1)
-
-            def add_command(cc, action, **args):
-                if cc['counter'] < 15:
-                    com = dict(action=action)
-                    com.update(args)
-                    new_commands[str(cc['counter'])] = com
-                    cc['counter'] += 1
-
-            event = controller.step(a)
-            visible_objects = []
-            InteractiveControllerPrompt.write_image(
-                event,
-                self.image_dir,
-                "_{}".format(self.counter),
-                image_per_frame=self.image_per_frame,
-                class_segmentation_frame=class_segmentation_frame,
-                instance_segmentation_frame=instance_segmentation_frame,
-                color_frame=color_frame,
-                depth_frame=depth_frame,
-                metadata=metadata
-            )
-
-            self.counter += 1
-            if self.has_object_actions:
-                for o in event.metadata['objects']:
-                    if o['visible']:
-                        visible_objects.append(o['objectId'])
-                        if o['openable']:
-                            if o['isOpen']:
-                                add_command(command_counter, 'CloseObject', objectId=o['objectId'])
+        # the drain runs even when a step or a write raises, so write errors surface
+        with terminal_input_mode(sys.stdin.fileno()), self.draining_writes():
+            for a in self.next_interact_command():
+                new_commands = {}
+                command_counter = count(1)
+
+                def add_command(action, **args):
+                    n = next(command_counter)
+                    if n < 15:
+                        new_commands[str(n)] = dict(action=action, **args)
+
+                event = controller.step(a)
+                visible_objects = []
+                self.write_image(
+                    event,
+                    "_{}".format(self.counter),
+                    class_segmentation_frame=class_segmentation_frame,
+                    instance_segmentation_frame=instance_segmentation_frame,
+                    color_frame=color_frame,
+                    depth_frame=depth_frame,
+                    metadata=metadata
+                )
+
+                self.counter += 1
+                if self.has_object_actions:
+                    meta = event.metadata
+                    visible = [o for o in meta['objects'] if o['visible']]
+                    visible_objects = sorted(map(itemgetter('objectId'), visible))
+                    # hoisted out of the object loop, so tolerate metadata without the key
+                    inventory = meta.get('inventoryObjects') or []
+                    inventoryObjectId = inventory[0]['objectId'] if inventory else None
+                    for o in visible:
+                        objectId = o['objectId']
+                        openable = o['openable']
+                        # isOpen is only read for openable objects, as before
+                        isOpen = openable and o['isOpen']
+                        if openable:
+                            if isOpen:
+                                add_command('CloseObject', objectId=objectId)
                             else:
-                                add_command(command_counter, 'OpenObject', objectId=o['objectId'])
+                                add_command('OpenObject', objectId=objectId)
 
                         if o['toggleable']:
-                            add_command(command_counter, 'ToggleObjectOff', objectId=o['objectId'])
-
-                        if len(event.metadata['inventoryObjects']) > 0:
-                            inventoryObjectId = event.metadata['inventoryObjects'][0]['objectId']
-                            if o['receptacle'] and (not o['openable'] or o['isOpen']) and inventoryObjectId != o['objectId']:
-                                add_command(command_counter, 'PutObject', objectId=inventoryObjectId, receptacleObjectId=o['objectId'])
-                                add_command(command_counter, 'MoveHandAhead', moveMagnitude=0.1)
-                                add_command(command_counter, 'MoveHandBack', moveMagnitude=0.1)
-                                add_command(command_counter, 'MoveHandRight', moveMagnitude=0.1)
-                                add_command(command_counter, 'MoveHandLeft', moveMagnitude=0.1)
-                                add_command(command_counter, 'MoveHandUp', moveMagnitude=0.1)
-                                add_command(command_counter, 'MoveHandDown', moveMagnitude=0.1)
-                                add_command(command_counter, 'DropHandObject')
+                            add_command('ToggleObjectOff', objectId=objectId)
+
+                        if inventoryObjectId is not None:
+                            if o['receptacle'] and (not openable or isOpen) and inventoryObjectId != objectId:
+                                add_command('PutObject', objectId=inventoryObjectId, receptacleObjectId=objectId)
+                                add_command('MoveHandAhead', moveMagnitude=0.1)
+                                add_command('MoveHandBack', moveMagnitude=0.1)
+                                add_command('MoveHandRight', moveMagnitude=0.1)
+                                add_command('MoveHandLeft', moveMagnitude=0.1)
+                                add_command('MoveHandUp', moveMagnitude=0.1)
+                                add_command('MoveHandDown', moveMagnitude=0.1)
+                                add_command('DropHandObject')
 
                         elif o['pickupable']:
-                            add_command(command_counter, 'PickupObject', objectId=o['objectId'])
+                            add_command('PickupObject', objectId=objectId)
 
-            self._interact_commands = default_interact_commands.copy()
-            self._interact_commands.update(new_commands)
+                self._interact_commands = ChainMap(new_commands, default_interact_commands)
+                self._interact_command_prefixes = self._default_command_prefixes | command_prefixes(new_commands)
 
-            print("Position: {}".format(event.metadata['agent']['position']))
-            print(command_message)
-            print("Visible Objects:\n" + "\n".join(sorted(visible_objects)))
+                # the step banner is written in one go rather than a print per line
+                lines = [
+                    "Position: {}".format(event.metadata['agent']['position']),
+                    command_message,
+                    "Visible Objects:\n" + "\n".join(visible_objects)
+                ]
 
-            skip_keys = ['action', 'objectId']
-            for k in sorted(new_commands.keys()):
-                v = new_commands[k]
-                command_info = [k + ")", v['action']]
-                if 'objectId' in v:
-                    command_info.append(v['objectId'])
+                skip_keys = ['action', 'objectId']
+                for k in sorted(new_commands.keys()):
+                    v = new_commands[k]
+                    command_info = [k + ")", v['action']]
+                    if 'objectId' in v:
+                        command_info.append(v['objectId'])
 
-                for a, av in v.items():
-                    if a in skip_keys:
-                        continue
-                    command_info.append("%s: %s" % (a, av))
+                    for a, av in v.items():
+                        if a in skip_keys:
+                            continue
+                        command_info.append("%s: %s" % (a, av))
 
-                print(' '.join(command_info))
+                    lines.append(' '.join(command_info))
+
+                lines.append('')
+                sys.stdout.write("\n".join(lines))
+                sys.stdout.flush()
 
     def next_interact_command(self):
+        fd = sys.stdin.fileno()
         current_buffer = ''
         while True:
-            commands = self._interact_commands
-            current_buffer += get_term_character()
-            if current_buffer == 'q' or current_buffer == '\x03':
-                break
-
-            if current_buffer in commands:
-                yield commands[current_buffer]
-                current_buffer = ''
-            else:
-                match = False
-                for k,v in commands.items():
-                    if k.startswith(current_buffer):
-                        match = True
-                        break
-
-                if not match:
+            try:
+                chars = get_term_character(fd)
+            except KeyboardInterrupt:
+                return
+
+            # a chunk may hold more than one key when keys repeat quickly
+            for ch in chars:
+                current_buffer += ch
+                if current_buffer == 'q' or current_buffer == '\x03':
+                    return
+
+                commands = self._interact_commands
+                if current_buffer in commands:
+                    yield commands[current_buffer]
+                    current_buffer = ''
+                elif current_buffer not in self._interact_command_prefixes:
                     current_buffer = ''
 
-    @classmethod
+    @contextmanager
+    def draining_writes(self):
+        try:
+            yield
+        except BaseException:
+            # don't let a write error replace the exception already unwinding
+            self.wait_for_writes(raise_errors=False)
+            raise
+        self.wait_for_writes()
+
+    def wait_for_writes(self, raise_errors=True):
+        """Block until queued frame writes finish.
+
+        The first write error is re-raised, or logged when raise_errors is False.
+        """
+        pending = self._pending_writes
+        self._pending_writes = []
+        wait(pending)
+        for f in pending:
+            exc = f.exception()
+            if exc is None:
+                continue
+            if raise_errors:
+                raise exc
+            logger.error("Failed to write frame", exc_info=exc)
+
+    def close(self):
+        self.wait_for_writes(raise_errors=False)
+        if self._io_pool is not None:
+            self._io_pool.shutdown(wait=True)
+            self._io_pool = None
+
+    def _scratch(self, attr, shape, dtype):
+        buf = getattr(self, attr)
+        if buf is None or buf.shape != shape or buf.dtype != dtype:
+            buf = np.empty(shape, dtype=dtype)
+            setattr(self, attr, buf)
+        return buf
+
+    def _depth_to_image(self, data):
+        out = self._scratch('_depth_scratch_u8', data.shape, np.uint8)
+        return cv2.normalize(data, out, 0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_8U)
+
+    def _queue_write(self, frame_filename, suffix, save, frame):
+        if frame is None:
+            print("No frame present, call initialize with the right parameters")
+            return
+
+        image_name = self._image_path_template % (frame_filename, suffix if self.image_per_frame else "")
+        if self.verbose:
+            print("Image {}, {}".format(image_name, self.image_dir))
+        if self._io_pool is None:
+            self._io_pool = ThreadPoolExecutor(max_workers=2)
+        self._pending_writes.append(self._io_pool.submit(save, image_name, frame))
+
     def write_image(
-            cls,
+            self,
             event,
-            image_dir,
             suffix,
-            image_per_frame=False,
             class_segmentation_frame=False,
             instance_segmentation_frame=False,
             depth_frame=False,
             color_frame=False,
             metadata=False
     ):
+        """Queue the requested frames of event for writing under image_dir.
 
-        def save_image(name, image, flip_br=False):
-            # TODO try to use PIL which did not work with RGBA
-            # image.save(
-            #     name
-            # )
-            import cv2
-            img = image
-            if flip_br:
-                img = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-            cv2.imwrite("{}.png".format(name), img)
-
-        def array_to_image(arr, mode=None):
-            return arr
-
-        def json_write(name, obj):
-            with open("{}.json".format(name), 'w') as outfile:
-                json.dump(obj, outfile, indent=4, sort_keys=True)
-
-        frame_writes = [
-            ('color',
-             color_frame,
-             lambda event: event.frame,
-             array_to_image,
-             lambda x, y: save_image(x, y, flip_br=True)
-             ),
-            ('instance_segmentation',
-             instance_segmentation_frame,
-             lambda event: event.instance_segmentation_frame,
-             array_to_image,
-             save_image
-             ),
-            ('class_segmentation',
-             class_segmentation_frame,
-             lambda event: event.class_segmentation_frame,
-             array_to_image,
-             save_image
-             ),
-            ('depth',
-             depth_frame,
-             lambda event: event.depth_frame,
-             lambda data: array_to_image(
-                 (255.0 / data.max() * (data - data.min())).astype(np.uint8)
-             ),
-             save_image
-             ),
-            ('depth_raw',
-             depth_frame,
-             lambda event: event.depth_frame,
-             lambda x: x,
-             lambda name, x: np.save(
-                 name.strip('.png').strip('./') if image_dir is '.' else name.strip('.png'),
-                 x.astype(np.float32)
-             )
-             ),
-            ('metadata',
-             metadata,
-             lambda event: event.metadata,
-             lambda x: x,
-             json_write
-             )
-        ]
-
-        for frame_filename, condition, frame_func, transform, save in frame_writes:
-            frame = frame_func(event)
-            if frame is not None:
-                frame = transform(frame)
-                image_name = os.path.join(
-                    image_dir,
-                    "{}{}"
-                        .format(
-                        frame_filename,
-                        "{}".format(suffix) if image_per_frame else ""
-                    )
-                )
-                print("Image {}, {}".format(image_name, image_dir))
-                save(image_name, frame)
+        Writes run on a background thread; callers outside interact() must call
+        wait_for_writes() (or use draining_writes()) before relying on the files.
+        """
+        # scratch buffers may still be referenced by the previous frame's writes
+        self.wait_for_writes()
+
+        if color_frame:
+            frame = event.cv2img if event.frame is not None else None
+            self._queue_write('color', suffix, save_image, frame)
+
+        if instance_segmentation_frame:
+            self._queue_write('instance_segmentation', suffix, save_image, event.instance_segmentation_frame)
+
+        if class_segmentation_frame:
+            self._queue_write('class_segmentation', suffix, save_image, event.class_segmentation_frame)
+
+        if depth_frame:
+            depth = event.depth_frame
+            self._queue_write('depth', suffix, save_image,
+                              self._depth_to_image(depth) if depth is not None else None)
+            self._queue_write('depth_raw', suffix, save_depth_raw, depth)
 
-            else:
-                print("No frame present, call initialize with the right parameters")
+        if metadata:
+            self._queue_write('metadata', suffix, json_write, event.metadata)
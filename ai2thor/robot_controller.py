@@ -67,7 +67,7 @@ class Controller(object):
         )
 
     def stop(self):
-        pass
+        self.interactive_controller.close()
 
     def start(
             self,
@@ -185,7 +185,7 @@ class Event(object):
             multiplier *= 1000
         image_depth_out *= multiplier / 256.0
 
-        depth_image_float = image_depth_out.astype(np.float32)
+        depth_image_float = image_depth_out.astype(np.float32, copy=False)
 
         if 'add_noise' in kwargs and kwargs['add_noise']:
             depth_image_float = apply_real_noise(
@@ -208,7 +208,7 @@ class Event(object):
         image_depth = read_buffer_image(
             image_depth_data, self.screen_width, self.screen_height, **kwargs
         ).reshape(self.screen_height, self.screen_width) * multiplier
-        self.depth_frame = image_depth.astype(np.float32)
+        self.depth_frame = image_depth.astype(np.float32, copy=False)
 
     def add_image_depth(self, image_depth_data, **kwargs):
         self.depth_frame = self._image_depth(image_depth_data, **kwargs)
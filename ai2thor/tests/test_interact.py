@@ -0,0 +1,322 @@
+from collections import ChainMap
+from contextlib import contextmanager
+import json
+import os
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+import ai2thor.interact
+from ai2thor.interact import InteractiveControllerPrompt, DefaultActions, command_prefixes
+
+
+class FakeEvent(object):
+
+    def __init__(self, frame=None, depth_frame=None, instance_segmentation_frame=None,
+                 class_segmentation_frame=None, metadata=None):
+        self.frame = frame
+        self.depth_frame = depth_frame
+        self.instance_segmentation_frame = instance_segmentation_frame
+        self.class_segmentation_frame = class_segmentation_frame
+        self.metadata = metadata
+
+    @property
+    def cv2img(self):
+        return self.frame[..., ::-1]
+
+
+class FakeStdin(object):
+
+    def fileno(self):
+        return 0
+
+
+@pytest.fixture
+def event():
+    frame = np.zeros((4, 6, 3), dtype=np.uint8)
+    frame[..., 0] = 255  # pure red in RGB
+    frame[0, 0] = [10, 20, 30]
+    depth = np.linspace(1.0, 5.0, 24, dtype=np.float32).reshape(4, 6)
+    seg = np.full((4, 6, 3), 7, dtype=np.uint8)
+    return FakeEvent(
+        frame=frame,
+        depth_frame=depth,
+        instance_segmentation_frame=seg,
+        class_segmentation_frame=seg.copy(),
+        metadata=dict(agent=dict(position=dict(x=0, y=0, z=0)))
+    )
+
+
+def write_image(event, image_dir, suffix='_0', image_per_frame=False, **flags):
+    prompt = InteractiveControllerPrompt(
+        list(DefaultActions),
+        image_dir=str(image_dir),
+        image_per_frame=image_per_frame
+    )
+    prompt.write_image(event, suffix, **flags)
+    prompt.wait_for_writes()
+
+
+def test_write_image_only_requested_frames(event, tmp_path):
+    write_image(event, tmp_path, color_frame=True, depth_frame=True)
+    assert set(os.listdir(str(tmp_path))) == {'color.png', 'depth.png', 'depth_raw.npy'}
+
+
+def test_write_image_all_frames_per_frame(event, tmp_path):
+    write_image(
+        event,
+        tmp_path,
+        suffix='_3',
+        image_per_frame=True,
+        class_segmentation_frame=True,
+        instance_segmentation_frame=True,
+        depth_frame=True,
+        color_frame=True,
+        metadata=True
+    )
+    assert set(os.listdir(str(tmp_path))) == {
+        'color_3.png',
+        'instance_segmentation_3.png',
+        'class_segmentation_3.png',
+        'depth_3.png',
+        'depth_raw_3.npy',
+        'metadata_3.json'
+    }
+    with open(str(tmp_path / 'metadata_3.json')) as f:
+        assert json.load(f) == event.metadata
+
+
+def test_write_image_color_bgr(event, tmp_path):
+    write_image(event, tmp_path, color_frame=True)
+    img = cv2.imread(str(tmp_path / 'color.png'))
+    assert np.array_equal(img, event.frame[..., ::-1])
+    assert list(img[1, 1]) == [0, 0, 255]
+
+
+def test_write_image_depth(event, tmp_path):
+    write_image(event, tmp_path, depth_frame=True)
+    img = cv2.imread(str(tmp_path / 'depth.png'), cv2.IMREAD_UNCHANGED)
+    assert img.dtype == np.uint8
+    assert img.min() == 0
+    assert img.max() == 255
+    raw = np.load(str(tmp_path / 'depth_raw.npy'))
+    assert raw.dtype == np.float32
+    assert np.array_equal(raw, event.depth_frame)
+
+
+def test_write_image_missing_frame(tmp_path, capsys):
+    write_image(FakeEvent(), tmp_path, color_frame=True)
+    assert os.listdir(str(tmp_path)) == []
+    assert "No frame present" in capsys.readouterr().out
+
+
+def test_write_image_percent_in_image_dir(event, tmp_path):
+    image_dir = tmp_path / 'x%d'
+    image_dir.mkdir()
+    write_image(event, image_dir, color_frame=True)
+    assert os.listdir(str(image_dir)) == ['color.png']
+
+
+def test_write_image_path_image_dir(event, tmp_path):
+    prompt = InteractiveControllerPrompt(list(DefaultActions), image_dir=tmp_path)
+    prompt.write_image(event, '_0', color_frame=True)
+    prompt.wait_for_writes()
+    assert os.listdir(str(tmp_path)) == ['color.png']
+
+
+def failing_save(name, frame):
+    raise IOError("disk full")
+
+
+def test_draining_writes_raises_write_error(event, tmp_path):
+    prompt = InteractiveControllerPrompt(list(DefaultActions), image_dir=str(tmp_path))
+    with pytest.raises(IOError):
+        with prompt.draining_writes():
+            prompt._queue_write('color', '_0', failing_save, event.frame)
+
+
+def test_draining_writes_keeps_original_exception(event, tmp_path):
+    prompt = InteractiveControllerPrompt(list(DefaultActions), image_dir=str(tmp_path))
+    with pytest.raises(KeyboardInterrupt):
+        with prompt.draining_writes():
+            prompt._queue_write('color', '_0', failing_save, event.frame)
+            raise KeyboardInterrupt()
+    assert prompt._pending_writes == []
+
+
+def test_close_then_write(event, tmp_path):
+    prompt = InteractiveControllerPrompt(list(DefaultActions), image_dir=str(tmp_path))
+    prompt.close()
+    prompt.write_image(event, '_0', color_frame=True)
+    prompt.close()
+    assert os.listdir(str(tmp_path)) == ['color.png']
+
+
+def interact_commands(chunks, monkeypatch):
+    prompt = InteractiveControllerPrompt(list(DefaultActions))
+    new_commands = {'1': dict(action='PickupObject', objectId='Apple|1')}
+    prompt._interact_commands = ChainMap(new_commands, prompt.default_interact_commands)
+    prompt._interact_command_prefixes = prompt._default_command_prefixes | command_prefixes(new_commands)
+
+    chunks = iter(chunks)
+
+    def get_term_character(fd):
+        chunk = next(chunks)
+        if isinstance(chunk, BaseException):
+            raise chunk
+        return chunk
+
+    monkeypatch.setattr(sys, 'stdin', FakeStdin())
+    monkeypatch.setattr(ai2thor.interact, 'get_term_character', get_term_character)
+    return [c['action'] for c in prompt.next_interact_command()]
+
+
+def test_next_interact_command(monkeypatch):
+    actions = interact_commands(
+        ['\x1b[A', '\x1b[1;2A\x1b[C', 'z1', 'i', 'q', 'i'],
+        monkeypatch
+    )
+    assert actions == ['MoveAhead', 'LookUp', 'MoveRight', 'PickupObject', 'LookUp']
+
+
+def test_next_interact_command_split_sequence(monkeypatch):
+    actions = interact_commands(['\x1b[1;', '2D', '\x03'], monkeypatch)
+    assert actions == ['RotateLeft']
+
+
+def test_next_interact_command_keyboard_interrupt(monkeypatch):
+    actions = interact_commands(['l', KeyboardInterrupt(), 'i'], monkeypatch)
+    assert actions == ['RotateRight']
+
+
+class FakeController(object):
+
+    def __init__(self, metadata):
+        self.metadata = metadata
+        self.actions = []
+
+    def step(self, action):
+        self.actions.append(action)
+        return FakeEvent(metadata=self.metadata)
+
+
+def obj(objectId, openable=False, receptacle=False, pickupable=False, **kwargs):
+    o = dict(
+        objectId=objectId,
+        visible=True,
+        openable=openable,
+        receptacle=receptacle,
+        pickupable=pickupable,
+        toggleable=False
+    )
+    o.update(kwargs)
+    return o
+
+
+def run_interact(objects, capsys, monkeypatch, inventory=None):
+    metadata = dict(agent=dict(position=dict(x=0, y=0, z=0)), objects=objects)
+    if inventory is not None:
+        metadata['inventoryObjects'] = [dict(objectId=i) for i in inventory]
+
+    @contextmanager
+    def terminal_input_mode(fd):
+        yield
+
+    chunks = iter(['l', 'q'])
+    monkeypatch.setattr(sys.stdout, 'isatty', lambda: True)
+    monkeypatch.setattr(sys, 'stdin', FakeStdin())
+    monkeypatch.setattr(ai2thor.interact, 'terminal_input_mode', terminal_input_mode)
+    monkeypatch.setattr(ai2thor.interact, 'get_term_character', lambda fd: next(chunks))
+
+    prompt = InteractiveControllerPrompt(list(DefaultActions))
+    controller = FakeController(metadata)
+    prompt.interact(controller)
+    assert controller.actions == [dict(action='RotateRight')]
+
+    new_commands = prompt._interact_commands.maps[0]
+    banner = capsys.readouterr().out.split("Position: ")[1]
+    return new_commands, banner
+
+
+def test_interact_nothing_visible(capsys, monkeypatch):
+    new_commands, banner = run_interact([obj('Apple|1', visible=False)], capsys, monkeypatch)
+    assert new_commands == {}
+    assert banner.endswith("Visible Objects:\n\n")
+
+
+def put_commands(objectId, receptacleObjectId):
+    return [
+        dict(action='PutObject', objectId=objectId, receptacleObjectId=receptacleObjectId),
+        dict(action='MoveHandAhead', moveMagnitude=0.1),
+        dict(action='MoveHandBack', moveMagnitude=0.1),
+        dict(action='MoveHandRight', moveMagnitude=0.1),
+        dict(action='MoveHandLeft', moveMagnitude=0.1),
+        dict(action='MoveHandUp', moveMagnitude=0.1),
+        dict(action='MoveHandDown', moveMagnitude=0.1),
+        dict(action='DropHandObject'),
+    ]
+
+
+def numbered(commands):
+    return {str(i): c for i, c in enumerate(commands, 1)}
+
+
+def test_interact_open_receptacle(capsys, monkeypatch):
+    new_commands, banner = run_interact(
+        [obj('Fridge|1', openable=True, receptacle=True, isOpen=True), obj('Apple|1', pickupable=True)],
+        capsys,
+        monkeypatch,
+        inventory=['Mug|1']
+    )
+    assert new_commands == numbered(
+        [dict(action='CloseObject', objectId='Fridge|1')] + put_commands('Mug|1', 'Fridge|1')
+    )
+    lines = banner.split("\n")
+    assert lines[0] == "{'x': 0, 'y': 0, 'z': 0}"
+    assert lines[2:5] == ["Visible Objects:", "Apple|1", "Fridge|1"]
+    assert lines[5] == "1) CloseObject Fridge|1"
+    assert lines[6] == "2) PutObject Mug|1 receptacleObjectId: Fridge|1"
+    assert lines[-1] == ""
+
+
+def test_interact_closed_receptacle(capsys, monkeypatch):
+    new_commands, _ = run_interact(
+        [obj('Fridge|1', openable=True, receptacle=True, isOpen=False)],
+        capsys,
+        monkeypatch,
+        inventory=['Mug|1']
+    )
+    assert new_commands == numbered([dict(action='OpenObject', objectId='Fridge|1')])
+
+
+def test_interact_without_is_open_or_inventory(capsys, monkeypatch):
+    # robot metadata can omit isOpen for non-openable objects and inventoryObjects
+    new_commands, banner = run_interact([obj('Apple|1', pickupable=True)], capsys, monkeypatch)
+    assert new_commands == numbered([dict(action='PickupObject', objectId='Apple|1')])
+    assert "1) PickupObject Apple|1\n" in banner
+
+
+def test_interact_held_object(capsys, monkeypatch):
+    new_commands, _ = run_interact(
+        [obj('Plate|1', receptacle=True, pickupable=True), obj('Table|1', receptacle=True)],
+        capsys,
+        monkeypatch,
+        inventory=['Plate|1']
+    )
+    assert new_commands == numbered(put_commands('Plate|1', 'Table|1'))
+
+
+def test_interact_command_cap(capsys, monkeypatch):
+    new_commands, banner = run_interact(
+        [obj('Table|1', receptacle=True), obj('Counter|1', receptacle=True)],
+        capsys,
+        monkeypatch,
+        inventory=['Mug|1']
+    )
+    candidates = put_commands('Mug|1', 'Table|1') + put_commands('Mug|1', 'Counter|1')
+    assert len(candidates) > 14
+    assert new_commands == numbered(candidates[:14])
+    assert "14) MoveHandUp moveMagnitude: 0.1\n" in banner
+    assert "15)" not in banner
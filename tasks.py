@@ -1057,18 +1057,22 @@ def interact(
         )
     )
 
-    from ai2thor.interact import InteractiveControllerPrompt
-    InteractiveControllerPrompt.write_image(
+    from ai2thor.interact import InteractiveControllerPrompt, DefaultActions
+    prompt = InteractiveControllerPrompt(
+        list(DefaultActions),
+        image_dir=image_directory,
+        image_per_frame=True
+    )
+    prompt.write_image(
         initialize_event,
-        image_directory,
         '_init',
-        image_per_frame=True,
         class_segmentation_frame=class_image,
         instance_segmentation_frame=object_image,
         color_frame=image,
         depth_frame=depth_image,
         metadata=metadata
     )
+    prompt.wait_for_writes()
 
     env.interact(
         class_segmentation_frame=class_image,
@@ -1139,7 +1143,12 @@ def get_depth(
         )
     )
 
-    from ai2thor.interact import InteractiveControllerPrompt
+    from ai2thor.interact import InteractiveControllerPrompt, DefaultActions
+    prompt = InteractiveControllerPrompt(
+        list(DefaultActions),
+        image_dir=image_directory,
+        image_per_frame=True
+    )
     if scene is not None:
         teleport_arg = dict(
             action="TeleportFull",
@@ -1161,11 +1170,9 @@ def get_depth(
             teleport_arg
         )
 
-        InteractiveControllerPrompt.write_image(
+        prompt.write_image(
             evt,
-            image_directory,
             '_{}'.format('teleport'),
-            image_per_frame=True,
             class_segmentation_frame=class_image,
             instance_segmentation_frame=object_image,
             color_frame=image,
@@ -1173,11 +1180,9 @@ def get_depth(
             metadata=metadata
         )
 
-    InteractiveControllerPrompt.write_image(
+    prompt.write_image(
         initialize_event,
-        image_directory,
         '_init',
-        image_per_frame=True,
         class_segmentation_frame=class_image,
         instance_segmentation_frame=object_image,
         color_frame=image,
@@ -1188,17 +1193,16 @@ def get_depth(
     for i in range(number):
         event = env.step(action='MoveAhead', moveMagnitude=0.0)
 
-        InteractiveControllerPrompt.write_image(
+        prompt.write_image(
             event,
-            image_directory,
             '_{}'.format(i),
-            image_per_frame=True,
             class_segmentation_frame=class_image,
             instance_segmentation_frame=object_image,
             color_frame=image,
             depth_frame=depth_image,
             metadata=metadata
         )
+    prompt.wait_for_writes()
     env.stop()
 
 @task